@@ -1,12 +1,373 @@
+import asyncio
+import atexit
+import functools
+import inspect
+import random
+import threading
+import time
+import weakref
 from abc import ABC, abstractmethod
-from typing import List, Dict
-from exceptions import InvalidAPIKeyError, APIConnectionError, APIResponseError
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Callable, Iterator, List, Dict, Optional
+import httpx
+import xxhash
+from context_manager import messages_hash
+from exceptions import (
+    InvalidAPIKeyError,
+    APIClientError,
+    APIConnectionError,
+    APIPoolTimeoutError,
+    APIResponseError,
+)
+from loguru import logger
+
+_HTTPX_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=128)
+# Асинхронный пул обслуживает все запросы сервера; у Ollama (HTTP/1.1) каждая
+# генерация занимает соединение целиком.
+_ASYNC_HTTPX_LIMITS = httpx.Limits(max_keepalive_connections=100, max_connections=200)
+_HTTPX_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+
+# Общий на процесс пул соединений (HTTP/2, требуется httpx[http2]) для всех клиентов,
+# чьи SDK позволяют подставить свой httpx-клиент. Закрывается через atexit.
+SHARED_HTTPX = httpx.Client(http2=True, limits=_HTTPX_LIMITS, timeout=_HTTPX_TIMEOUT)
+atexit.register(SHARED_HTTPX.close)
+
+# Соединения httpx.AsyncClient привязаны к event loop, в котором открыты, поэтому
+# асинхронный пул свой у каждого работающего цикла и создаётся при первом обращении.
+_async_httpx: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def shared_async_httpx() -> httpx.AsyncClient:
+    """Асинхронный пул соединений текущего event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_httpx.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            http2=True, limits=_ASYNC_HTTPX_LIMITS, timeout=_HTTPX_TIMEOUT
+        )
+        _async_httpx[loop] = client
+    return client
+
+
+async def close_shared_async_httpx() -> None:
+    """Закрывает пул текущего цикла; следующий shared_async_httpx() создаст новый."""
+    client = _async_httpx.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+class CircuitBreaker:
+    """Размыкается после failure_threshold сбоев подряд и до истечения reset_timeout
+    отклоняет вызовы сразу; затем пропускает один пробный вызов (half-open)."""
+
+    def __init__(
+        self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._opened_at is None:
+                return
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_timeout:
+                raise APIConnectionError(
+                    f"{self.name} circuit is open: provider calls are suspended after repeated failures"
+                )
+            # Пробный вызов: остальные продолжают получать отказ до его результата.
+            self._opened_at = now
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(
+                        f"{self.name}: {self._failures} сбоев подряд, цепь разомкнута на {self.reset_timeout} с."
+                    )
+                self._opened_at = time.monotonic()
+
+    def record(self, error: Optional[BaseException]) -> None:
+        if error is None or not _is_outage(error):
+            self.record_success()
+        else:
+            self.record_failure()
+
+
+def _is_outage(error: BaseException) -> bool:
+    # Нет свободного соединения в своём пуле — перегрузка сервера, а не сбой провайдера.
+    if isinstance(error, APIPoolTimeoutError):
+        return False
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIResponseError) and (
+        error.status_code == 429 or error.status_code >= 500
+    )
+
+
+_RETRYABLE_STATUS_CODES = frozenset({429, 503})
+
+
+def _is_retryable(error: APIClientError) -> bool:
+    if isinstance(error, APIPoolTimeoutError):
+        return False
+    if isinstance(error, APIConnectionError):
+        return True
+    return (
+        isinstance(error, APIResponseError)
+        and error.status_code in _RETRYABLE_STATUS_CODES
+    )
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Значение заголовка Retry-After в секундах (формат HTTP-date не поддерживается)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def circuit_breaker(func):
+    """Пропускает вызов через CircuitBreaker клиента (атрибут класса _breaker)."""
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(self, messages: List[Dict[str, str]]) -> str:
+            self._breaker.before_call()
+            try:
+                result = await func(self, messages)
+            except APIClientError as e:
+                self._breaker.record(e)
+                raise
+            self._breaker.record_success()
+            return result
+
+        return async_wrapper
+
+    if inspect.isasyncgenfunction(func):
+
+        @functools.wraps(func)
+        async def astream_wrapper(
+            self, messages: List[Dict[str, str]]
+        ) -> AsyncIterator[str]:
+            self._breaker.before_call()
+            try:
+                async for chunk in func(self, messages):
+                    yield chunk
+            except APIClientError as e:
+                self._breaker.record(e)
+                raise
+            self._breaker.record_success()
+
+        return astream_wrapper
+
+    if inspect.isgeneratorfunction(func):
+
+        @functools.wraps(func)
+        def stream_wrapper(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+            self._breaker.before_call()
+            try:
+                yield from func(self, messages)
+            except APIClientError as e:
+                self._breaker.record(e)
+                raise
+            self._breaker.record_success()
+
+        return stream_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, messages: List[Dict[str, str]]) -> str:
+        self._breaker.before_call()
+        try:
+            result = func(self, messages)
+        except APIClientError as e:
+            self._breaker.record(e)
+            raise
+        self._breaker.record_success()
+        return result
+
+    return wrapper
+
+
+def cached_response(func):
+    """Оборачивает send_request/asend_request клиента в LRU-кэш ответов.
+
+    Обёртка принимает необязательный context_hash (ConversationContext.context_hash()),
+    чтобы не хэшировать историю заново при каждом запросе.
+    """
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(
+            self,
+            messages: List[Dict[str, str]],
+            *,
+            context_hash: Optional[bytes] = None,
+        ) -> str:
+            if not self.cache_size:
+                return await func(self, messages)
+            key = self._cache_key(messages, context_hash)
+            cached = self._cache_lookup(key)
+            if cached is not None:
+                return cached
+            result = await func(self, messages)
+            self._cache_store(key, result)
+            return result
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        context_hash: Optional[bytes] = None,
+    ) -> str:
+        if not self.cache_size:
+            return func(self, messages)
+        key = self._cache_key(messages, context_hash)
+        cached = self._cache_lookup(key)
+        if cached is not None:
+            return cached
+        result = func(self, messages)
+        self._cache_store(key, result)
+        return result
+
+    return wrapper
 
 
 class BaseAPIClient(ABC):
-    def __init__(self, api_key: str):
+    _breaker: CircuitBreaker
+    # Повторы при 429/503 и ошибках соединения: экспоненциальная пауза с джиттером,
+    # общий бюджет retry_deadline секунд на все попытки.
+    retry_attempts: int = 3
+    retry_backoff_base: float = 0.25
+    retry_backoff_cap: float = 4.0
+    retry_deadline: float = 30.0
+
+    def __init__(self, api_key: str, cache_size: int = 0):
+        # cache_size > 0 включает LRU-кэш ответов клиента (cached_response);
+        # только для детерминированных вызовов, по умолчанию выключен.
         self.api_key = api_key
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, str]" = OrderedDict()
+        self._cache_lock = threading.Lock()
 
     @abstractmethod
     def send_request(self, messages: List[Dict[str, str]]) -> str:
         pass
+
+    @abstractmethod
+    async def asend_request(self, messages: List[Dict[str, str]]) -> str:
+        pass
+
+    @abstractmethod
+    def send_request_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        pass
+
+    @abstractmethod
+    def asend_request_stream(
+        self, messages: List[Dict[str, str]]
+    ) -> AsyncIterator[str]:
+        pass
+
+    def send_batch(
+        self, batch: List[List[Dict[str, str]]], max_concurrency: int = 16
+    ) -> List[str]:
+        """Отправляет независимые диалоги параллельно через общий пул соединений.
+
+        Ответы возвращаются в порядке batch; первая ошибка пробрасывается.
+        """
+        if not batch:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(batch))) as pool:
+            return list(pool.map(self.send_request, batch))
+
+    async def asend_batch(self, batch: List[List[Dict[str, str]]]) -> List[str]:
+        return list(await asyncio.gather(*(self.asend_request(m) for m in batch)))
+
+    async def awarmup(self) -> None:
+        """Дешёвый запрос к провайдеру, чтобы заранее открыть соединение (DNS + TLS)."""
+
+    def _retry_delay(
+        self, error: APIClientError, attempt: int, deadline: float
+    ) -> Optional[float]:
+        """Пауза перед следующей попыткой или None, если повторять нельзя."""
+        if attempt + 1 >= self.retry_attempts or not _is_retryable(error):
+            return None
+        delay = min(self.retry_backoff_cap, self.retry_backoff_base * 2**attempt)
+        delay *= random.uniform(0.5, 1.5)
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if time.monotonic() + delay > deadline:
+            return None
+        logger.warning(
+            f"{type(self).__name__}: попытка {attempt + 1} не удалась ({error}), повтор через {delay:.2f} с."
+        )
+        return delay
+
+    def _retry(self, call: Callable[[], str]) -> str:
+        deadline = time.monotonic() + self.retry_deadline
+        attempt = 0
+        while True:
+            try:
+                return call()
+            except APIClientError as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def _aretry(self, call: Callable[[], Awaitable[str]]) -> str:
+        deadline = time.monotonic() + self.retry_deadline
+        attempt = 0
+        while True:
+            try:
+                return await call()
+            except APIClientError as e:
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def clear_cache(self) -> None:
+        with self._cache_lock:
+            self._cache.clear()
+
+    def _cache_key(
+        self, messages: List[Dict[str, str]], context_hash: Optional[bytes] = None
+    ) -> bytes:
+        model = getattr(self, "model_name", None) or getattr(self, "model", "")
+        if context_hash is None:
+            context_hash = messages_hash(messages)
+        return xxhash.xxh3_128_digest(context_hash + model.encode())
+
+    def _cache_lookup(self, key: bytes) -> Optional[str]:
+        with self._cache_lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+            return result
+
+    def _cache_store(self, key: bytes, value: str) -> None:
+        with self._cache_lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
@@ -1,75 +1,191 @@
-from typing import List, Dict
-from .base_client import BaseAPIClient
-from config import settings
+from typing import AsyncIterator, Iterator, List, Dict, Any, Optional
+from .base_client import (
+    BaseAPIClient,
+    CircuitBreaker,
+    SHARED_HTTPX,
+    cached_response,
+    circuit_breaker,
+    shared_async_httpx,
+    parse_retry_after,
+)
+from config import get_settings
 from exceptions import (
     InvalidAPIKeyError,
     APIConnectionError,
+    APIPoolTimeoutError,
     APIResponseError,
     APIClientError,
 )
 from loguru import logger
 import httpx
+import orjson
 
 DEEPSEEK_API_URL = "https://api.deepseek.com/chat/completions"
-
+DEEPSEEK_MODELS_URL = "https://api.deepseek.com/models"
 
 class DeepSeekClient(BaseAPIClient):
+    _breaker = CircuitBreaker("DeepSeekClient")
+    _client: httpx.Client = SHARED_HTTPX
+
     def __init__(
-        self, api_key: str = settings.DEEPSEEK_API_KEY, model: str = "deepseek-chat"
+        self,
+        api_key: Optional[str] = None,
+        model: str = "deepseek-chat",
+        cache_size: int = 0,
     ):
+        if api_key is None:
+            api_key = get_settings().DEEPSEEK_API_KEY
         if not api_key:
             raise InvalidAPIKeyError(
                 "DeepSeek API key not found. Set it in .env or pass it directly."
             )
-        super().__init__(api_key)
+        super().__init__(api_key, cache_size=cache_size)
         self.model = model
-
-    def send_request(self, messages: List[Dict[str, str]]) -> str:
-        logger.info(
-            f"DeepSeekClient: отправка запроса к {self.model} с {len(messages)} сообщениями."
-        )
-        logger.debug(f"DeepSeekClient: сообщения: {messages}")
-
-        headers = {
+        self._headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
+        self._payload_base: Dict[str, Any] = {"model": self.model, "stream": False}
 
-        payload = {"model": self.model, "messages": messages, "stream": False}
+    @property
+    def _aclient(self) -> httpx.AsyncClient:
+        return shared_async_httpx()
 
-        try:
-            with httpx.Client() as client:
-                response = client.post(
-                    DEEPSEEK_API_URL, headers=headers, json=payload, timeout=30.0
-                )
-                response.raise_for_status()
+    @cached_response
+    @circuit_breaker
+    def send_request(self, messages: List[Dict[str, str]]) -> str:
+        headers, payload = self._prepare_request(messages)
+        return self._retry(lambda: self._post(headers, payload))
 
-            response_data = response.json()
-            if response_data.get("choices") and len(response_data["choices"]) > 0:
-                message = response_data["choices"][0].get("message")
-                if message and message.get("content"):
-                    result = message["content"]
-                    logger.info("DeepSeekClient: успешный ответ получен.")
-                    return result
+    @cached_response
+    @circuit_breaker
+    async def asend_request(self, messages: List[Dict[str, str]]) -> str:
+        headers, payload = self._prepare_request(messages)
+        return await self._aretry(lambda: self._apost(headers, payload))
 
-            logger.error(
-                f"DeepSeekClient: непредвиденная структура ответа: {response_data}"
+    async def awarmup(self) -> None:
+        await self._aclient.get(DEEPSEEK_MODELS_URL, headers=self._headers)
+
+    def _post(self, headers: Dict[str, str], payload: Dict[str, Any]) -> str:
+        try:
+            response = self._client.post(
+                DEEPSEEK_API_URL, headers=headers, content=orjson.dumps(payload)
             )
-            raise APIResponseError(
-                status_code=response.status_code,
-                message=f"Непредвиденная структура ответа: {response_data}",
+            response.raise_for_status()
+            return self._parse_response(response)
+        except Exception as e:
+            raise self._map_error(e)
+
+    async def _apost(self, headers: Dict[str, str], payload: Dict[str, Any]) -> str:
+        try:
+            response = await self._aclient.post(
+                DEEPSEEK_API_URL, headers=headers, content=orjson.dumps(payload)
             )
+            response.raise_for_status()
+            return self._parse_response(response)
+        except Exception as e:
+            raise self._map_error(e)
 
-        except httpx.HTTPStatusError as e:
+    @circuit_breaker
+    def send_request_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        headers, payload = self._prepare_request(messages)
+        payload["stream"] = True
+        try:
+            with self._client.stream(
+                "POST", DEEPSEEK_API_URL, headers=headers, content=orjson.dumps(payload)
+            ) as response:
+                if response.is_error:
+                    response.read()
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    content = self._stream_delta(data)
+                    if content:
+                        yield content
+            logger.debug("DeepSeekClient: потоковый ответ получен.")
+        except Exception as e:
+            raise self._map_error(e)
+
+    @circuit_breaker
+    async def asend_request_stream(
+        self, messages: List[Dict[str, str]]
+    ) -> AsyncIterator[str]:
+        headers, payload = self._prepare_request(messages)
+        payload["stream"] = True
+        try:
+            async with self._aclient.stream(
+                "POST", DEEPSEEK_API_URL, headers=headers, content=orjson.dumps(payload)
+            ) as response:
+                if response.is_error:
+                    await response.aread()
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    content = self._stream_delta(data)
+                    if content:
+                        yield content
+            logger.debug("DeepSeekClient: потоковый ответ получен.")
+        except Exception as e:
+            raise self._map_error(e)
+
+    @staticmethod
+    def _stream_delta(data: str) -> Optional[str]:
+        choices = orjson.loads(data).get("choices")
+        if choices:
+            return (choices[0].get("delta") or {}).get("content")
+        return None
+
+    def _prepare_request(self, messages: List[Dict[str, str]]):
+        logger.debug(
+            f"DeepSeekClient: отправка запроса к {self.model} с {len(messages)} сообщениями."
+        )
+        logger.debug("DeepSeekClient: сообщения: {}", messages)
+
+        payload = {**self._payload_base, "messages": messages}
+        return self._headers, payload
+
+    def _parse_response(self, response: httpx.Response) -> str:
+        response_data = orjson.loads(response.content)
+        if response_data.get("choices") and len(response_data["choices"]) > 0:
+            message = response_data["choices"][0].get("message")
+            if message and message.get("content"):
+                result = message["content"]
+                logger.debug("DeepSeekClient: успешный ответ получен.")
+                return result
+
+        logger.error(
+            f"DeepSeekClient: непредвиденная структура ответа: {response_data}"
+        )
+        raise APIResponseError(
+            status_code=response.status_code,
+            message=f"Непредвиденная структура ответа: {response_data}",
+        )
+
+    def _map_error(self, e: Exception) -> APIClientError:
+        if isinstance(e, APIClientError):
+            return e
+        if isinstance(e, httpx.HTTPStatusError):
             logger.error(
                 f"DeepSeekClient: ошибка HTTP статуса {e.response.status_code}: {e.response.text}"
             )
-            raise APIResponseError(
-                status_code=e.response.status_code, message=e.response.text
+            return APIResponseError(
+                status_code=e.response.status_code,
+                message=e.response.text,
+                retry_after=parse_retry_after(e.response.headers.get("Retry-After")),
             )
-        except httpx.RequestError as e:
+        if isinstance(e, httpx.PoolTimeout):
+            logger.error(f"DeepSeekClient: нет свободного соединения в пуле: {e}")
+            return APIPoolTimeoutError(f"DeepSeek connection pool exhausted: {e}")
+        if isinstance(e, httpx.RequestError):
             logger.error(f"DeepSeekClient: ошибка соединения или запроса: {e}")
-            raise APIConnectionError(f"DeepSeek API connection/request error: {e}")
-        except Exception as e:
-            logger.exception("DeepSeekClient: непредвиденная ошибка.")
-            raise APIClientError(f"Unexpected error in DeepSeek client: {e}")
+            return APIConnectionError(f"DeepSeek API connection/request error: {e}")
+        logger.exception("DeepSeekClient: непредвиденная ошибка.")
+        return APIClientError(f"Unexpected error in DeepSeek client: {e}")
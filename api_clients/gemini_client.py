@@ -1,6 +1,15 @@
-from typing import List, Dict, Optional
-from .base_client import BaseAPIClient
-from config import settings
+import hashlib
+import re
+import threading
+from itertools import islice
+from typing import AsyncIterator, Iterator, List, Dict, Optional
+from .base_client import (
+    BaseAPIClient,
+    CircuitBreaker,
+    cached_response,
+    circuit_breaker,
+)
+from config import get_settings
 from exceptions import (
     InvalidAPIKeyError,
     APIConnectionError,
@@ -8,22 +17,54 @@ from exceptions import (
     APIClientError,
 )
 from loguru import logger
-import google.generativeai as genai
+from cachetools import TTLCache
+
+# google.generativeai (protobuf, grpc) импортируется при создании первого клиента.
+genai = None
+
+
+def _ensure_genai():
+    global genai
+    if genai is None:
+        import google.generativeai as _genai
+
+        genai = _genai
+    return genai
+
+
+# Список моделей на хэш API ключа: list_models() — сетевой запрос при каждом создании клиента.
+_models_cache: TTLCache = TTLCache(maxsize=4, ttl=3600)
+_models_cache_lock = threading.Lock()
+
+_KEY_ERROR_RE = re.compile(r"API_KEY_(?:INVALID|EXPIRED|BLOCKED)|PERMISSION_DENIED")
+_MODEL_ERROR_RE = re.compile(
+    r"is not found for API version|Call ListModels|could not be found"
+)
 
 
 class GeminiClient(BaseAPIClient):
+    _breaker = CircuitBreaker("GeminiClient")
+
     def __init__(
-        self, api_key: str = settings.GEMINI_API_KEY, model_name: str = "gemini-2.0-flash"
+        self,
+        api_key: Optional[str] = None,
+        model_name: str = "gemini-2.0-flash",
+        cache_size: int = 0,
     ):
+        if api_key is None:
+            api_key = get_settings().GEMINI_API_KEY
         if not api_key:
             raise InvalidAPIKeyError(
                 "Gemini API key not found. Set it in .env or pass it directly."
             )
-        super().__init__(api_key)
+        super().__init__(api_key, cache_size=cache_size)
         self.model_name = model_name
         try:
+            _ensure_genai()
             genai.configure(api_key=self.api_key)
             self._check_model_availability()
+            self._model_obj = genai.GenerativeModel(model_name=self.model_name)
+            self._generation_config = genai.types.GenerationConfig(candidate_count=1)
         except Exception as e:
             logger.error(f"GeminiClient: ошибка конфигурации genai или проверки модели: {e}")
             if not isinstance(e, (InvalidAPIKeyError, APIClientError)):
@@ -58,93 +99,169 @@ class GeminiClient(BaseAPIClient):
             logger.error(f"GeminiClient: Ошибка при проверке доступности модели {self.model_name}: {e}")
             raise APIClientError(f"Failed to verify model {self.model_name} availability: {e}")
 
-    def list_models(self) -> List[genai.types.Model]:
+    def list_models(self) -> List["genai.types.Model"]:
+        key_hash = hashlib.sha256(self.api_key.encode()).hexdigest()
+        with _models_cache_lock:
+            cached = _models_cache.get(key_hash)
+        if cached is not None:
+            logger.debug("GeminiClient: список моделей взят из кэша ({} моделей)", len(cached))
+            return cached
+
         try:
             models_iterable = genai.list_models()
             models_list = list(models_iterable)
             logger.info(f"GeminiClient: найдено {len(models_list)} моделей")
             for model_info in models_list:
-                logger.debug(f"Доступная модель: {model_info.name}, поддерживает: {model_info.supported_generation_methods}")
+                logger.debug(
+                    "Доступная модель: {}, поддерживает: {}",
+                    model_info.name,
+                    model_info.supported_generation_methods,
+                )
+            with _models_cache_lock:
+                _models_cache[key_hash] = models_list
             return models_list
         except Exception as e:
             logger.error(f"GeminiClient: ошибка при получении списка моделей: {e}")
             raise APIClientError(f"Failed to list Gemini models: {e}")
 
+    @cached_response
+    @circuit_breaker
     def send_request(self, messages: List[Dict[str, str]]) -> str:
-        logger.info(
-            f"GeminiClient: отправка запроса к {self.model_name} с {len(messages)} сообщениями."
-        )
-        logger.debug(f"GeminiClient: сообщения: {messages}")
+        contents_for_api = self._prepare_request(messages)
+        return self._retry(lambda: self._generate(contents_for_api))
 
+    @cached_response
+    @circuit_breaker
+    async def asend_request(self, messages: List[Dict[str, str]]) -> str:
+        contents_for_api = self._prepare_request(messages)
+        return await self._aretry(lambda: self._agenerate(contents_for_api))
+
+    def _generate(self, contents_for_api: List[Dict[str, List[str]]]) -> str:
         try:
-            model_obj = genai.GenerativeModel(model_name=self.model_name)
-            
-            contents_for_api: List[Dict[str, List[str]]] = []
-            system_instruction_content: Optional[str] = None
-
-            processed_messages = list(messages)
-            if processed_messages and processed_messages[0]["role"] == "system":
-                system_instruction_content = processed_messages.pop(0)["content"]
-
-            if system_instruction_content:
-                if processed_messages and processed_messages[0]["role"] == "user":
-                    processed_messages[0]["content"] = system_instruction_content + "\n\n" + processed_messages[0]["content"]
-                elif not processed_messages:
-                    processed_messages.append({"role": "user", "content": system_instruction_content})
-                else:
-                    processed_messages.insert(0, {"role": "user", "content": system_instruction_content})
-
-            for msg in processed_messages:
-                role = "user" if msg["role"] == "user" else "model"
-                contents_for_api.append({"role": role, "parts": [msg["content"]]})
-
-            if not contents_for_api:
-                logger.error("GeminiClient: Контекст для API пуст.")
-                contents_for_api.append({"role": "user", "parts": ["Hello"]})
-            elif contents_for_api[-1]["role"] != "user":
-                 logger.warning("GeminiClient: Последнее сообщение в API-контексте не от пользователя. Добавляю 'Продолжай'.")
-                 contents_for_api.append({"role": "user", "parts": ["Продолжай"]})
-
-            model_to_use = model_obj
-
-            response = model_to_use.generate_content(
+            response = self._model_obj.generate_content(
                 contents=contents_for_api,
-                generation_config=genai.types.GenerationConfig(candidate_count=1)
+                generation_config=self._generation_config,
             )
-            
-            if response.candidates and response.candidates[0].content.parts:
-                result = "".join(part.text for part in response.candidates[0].content.parts)
-                logger.info("GeminiClient: успешный ответ получен.")
-                return result
-            else:
-                logger.error(
-                    f"GeminiClient: непредвиденная структура ответа или пустой ответ: {response}"
-                )
-                if response.prompt_feedback and response.prompt_feedback.block_reason:
-                    error_message = f"Запрос заблокирован: {response.prompt_feedback.block_reason}. {response.prompt_feedback.block_reason_message if response.prompt_feedback.block_reason_message else ''}"
-                    logger.error(f"GeminiClient: {error_message}")
-                    raise APIResponseError(status_code=0, message=error_message)
-                raise APIResponseError(
-                    status_code=0,
-                    message=f"Непредвиденная структура ответа или пустой ответ от Gemini: {response}",
-                )
+            return self._parse_response(response)
+        except Exception as e:
+            raise self._map_error(e)
 
+    async def _agenerate(self, contents_for_api: List[Dict[str, List[str]]]) -> str:
+        try:
+            response = await self._model_obj.generate_content_async(
+                contents=contents_for_api,
+                generation_config=self._generation_config,
+            )
+            return self._parse_response(response)
         except Exception as e:
-            logger.exception(f"GeminiClient: непредвиденная ошибка: {e}")
- 
-            if (
-                "API_KEY_INVALID" in str(e)
-                or "API_KEY_EXPIRED" in str(e)
-                or "API_KEY_BLOCKED" in str(e)
-                or "PERMISSION_DENIED" in str(e)
-            ):
-                raise InvalidAPIKeyError(f"Gemini API key/permission error: {e}")
-            
-            if "is not found for API version" in str(e) or "Call ListModels" in str(e) or "could not be found" in str(e):
-                logger.error(f"GeminiClient: Модель {self.model_name} не найдена или не поддерживает generateContent. {e}")
-                raise APIResponseError(status_code=404, message=f"Model {self.model_name} not found or not supported: {e}")
-
-            if isinstance(e, (APIClientError, InvalidAPIKeyError, APIResponseError, APIConnectionError)):
-                raise
- 
-            raise APIClientError(f"Unexpected error in Gemini client: {e}")
+            raise self._map_error(e)
+
+    @circuit_breaker
+    def send_request_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        try:
+            contents_for_api = self._prepare_request(messages)
+            response = self._model_obj.generate_content(
+                contents=contents_for_api,
+                generation_config=self._generation_config,
+                stream=True,
+            )
+            for chunk in response:
+                if chunk.candidates and chunk.candidates[0].content.parts:
+                    yield "".join(part.text for part in chunk.candidates[0].content.parts)
+            logger.debug("GeminiClient: потоковый ответ получен.")
+        except Exception as e:
+            raise self._map_error(e)
+
+    @circuit_breaker
+    async def asend_request_stream(
+        self, messages: List[Dict[str, str]]
+    ) -> AsyncIterator[str]:
+        try:
+            contents_for_api = self._prepare_request(messages)
+            response = await self._model_obj.generate_content_async(
+                contents=contents_for_api,
+                generation_config=self._generation_config,
+                stream=True,
+            )
+            async for chunk in response:
+                if chunk.candidates and chunk.candidates[0].content.parts:
+                    yield "".join(part.text for part in chunk.candidates[0].content.parts)
+            logger.debug("GeminiClient: потоковый ответ получен.")
+        except Exception as e:
+            raise self._map_error(e)
+
+    def _prepare_request(self, messages: List[Dict[str, str]]):
+        logger.debug(
+            f"GeminiClient: отправка запроса к {self.model_name} с {len(messages)} сообщениями."
+        )
+        logger.debug("GeminiClient: сообщения: {}", messages)
+
+        contents_for_api: List[Dict[str, List[str]]] = []
+        system_instruction_content: Optional[str] = None
+        start = 0
+
+        if messages and messages[0]["role"] == "system":
+            system_instruction_content = messages[0]["content"]
+            start = 1
+
+        if system_instruction_content:
+            if start < len(messages) and messages[start]["role"] == "user":
+                contents_for_api.append({
+                    "role": "user",
+                    "parts": [system_instruction_content + "\n\n" + messages[start]["content"]],
+                })
+                start += 1
+            else:
+                contents_for_api.append({"role": "user", "parts": [system_instruction_content]})
+
+        for msg in islice(messages, start, None):
+            role = "user" if msg["role"] == "user" else "model"
+            contents_for_api.append({"role": role, "parts": [msg["content"]]})
+
+        if not contents_for_api:
+            logger.error("GeminiClient: Контекст для API пуст.")
+            contents_for_api.append({"role": "user", "parts": ["Hello"]})
+        elif contents_for_api[-1]["role"] != "user":
+             logger.warning("GeminiClient: Последнее сообщение в API-контексте не от пользователя. Добавляю 'Продолжай'.")
+             contents_for_api.append({"role": "user", "parts": ["Продолжай"]})
+
+        return contents_for_api
+
+    def _parse_response(self, response) -> str:
+        if response.candidates and response.candidates[0].content.parts:
+            result = "".join(part.text for part in response.candidates[0].content.parts)
+            logger.debug("GeminiClient: успешный ответ получен.")
+            return result
+        else:
+            logger.error(
+                f"GeminiClient: непредвиденная структура ответа или пустой ответ: {response}"
+            )
+            if response.prompt_feedback and response.prompt_feedback.block_reason:
+                error_message = f"Запрос заблокирован: {response.prompt_feedback.block_reason}. {response.prompt_feedback.block_reason_message if response.prompt_feedback.block_reason_message else ''}"
+                logger.error(f"GeminiClient: {error_message}")
+                raise APIResponseError(status_code=0, message=error_message)
+            raise APIResponseError(
+                status_code=0,
+                message=f"Непредвиденная структура ответа или пустой ответ от Gemini: {response}",
+            )
+
+    def _map_error(self, e: Exception) -> APIClientError:
+        logger.exception(f"GeminiClient: непредвиденная ошибка: {e}")
+
+        error_text = str(e)
+        if _KEY_ERROR_RE.search(error_text):
+            return InvalidAPIKeyError(f"Gemini API key/permission error: {e}")
+
+        if _MODEL_ERROR_RE.search(error_text):
+            logger.error(f"GeminiClient: Модель {self.model_name} не найдена или не поддерживает generateContent. {e}")
+            return APIResponseError(status_code=404, message=f"Model {self.model_name} not found or not supported: {e}")
+
+        if isinstance(e, (APIClientError, InvalidAPIKeyError, APIResponseError, APIConnectionError)):
+            return e
+
+        # google.api_core: ResourceExhausted (429), ServiceUnavailable (503), DeadlineExceeded (504)...
+        status_code = getattr(e, "code", None)
+        if isinstance(status_code, int) and (status_code == 429 or status_code >= 500):
+            return APIResponseError(status_code=int(status_code), message=str(e))
+
+        return APIClientError(f"Unexpected error in Gemini client: {e}")
@@ -1,37 +1,181 @@
-import requests
-from typing import List, Dict, Optional
-from .base_client import BaseAPIClient
-from config import settings
-from exceptions import APIConnectionError, APIResponseError, APIClientError
+from typing import AsyncIterator, Iterator, List, Dict, Optional, Any, Tuple
+from .base_client import (
+    BaseAPIClient,
+    CircuitBreaker,
+    SHARED_HTTPX,
+    cached_response,
+    circuit_breaker,
+    shared_async_httpx,
+)
+from config import get_settings
+from exceptions import (
+    APIConnectionError,
+    APIPoolTimeoutError,
+    APIResponseError,
+    APIClientError,
+)
 from loguru import logger
+import httpx
+import orjson
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+_OLLAMA_TIMEOUT = httpx.Timeout(120.0, connect=5.0)
 
 
 class OllamaClient(BaseAPIClient):
+    _breaker = CircuitBreaker("OllamaClient")
+    _client: httpx.Client = SHARED_HTTPX
+
     def __init__(
-        self, model_name: str = "qwen2.5:7b", api_url: str = settings.OLLAMA_API_URL
+        self,
+        model_name: str = "qwen2.5:7b",
+        api_url: Optional[str] = None,
+        cache_size: int = 0,
     ):
-        super().__init__(api_key=None)
+        super().__init__(api_key=None, cache_size=cache_size)
+        if api_url is None:
+            api_url = get_settings().OLLAMA_API_URL
         self.model_name = model_name
         self.api_url = api_url.rstrip("/") + "/api/generate"
+        self._tags_url = api_url.rstrip("/") + "/api/tags"
+        self._payload_base: Dict[str, Any] = {"model": self.model_name, "stream": False}
+        self._prompt_cache: Tuple[List[Dict[str, str]], str] = ([], "")
+
+    @property
+    def _aclient(self) -> httpx.AsyncClient:
+        return shared_async_httpx()
 
+    @cached_response
+    @circuit_breaker
     def send_request(self, messages: List[Dict[str, str]]) -> str:
-        logger.info(
+        payload = self._build_payload(messages)
+        return self._retry(lambda: self._post(payload))
+
+    @cached_response
+    @circuit_breaker
+    async def asend_request(self, messages: List[Dict[str, str]]) -> str:
+        payload = self._build_payload(messages)
+        return await self._aretry(lambda: self._apost(payload))
+
+    async def awarmup(self) -> None:
+        await self._aclient.get(self._tags_url, timeout=_OLLAMA_TIMEOUT)
+
+    def _post(self, payload: Dict[str, Any]) -> str:
+        try:
+            response = self._client.post(
+                self.api_url,
+                headers=_JSON_HEADERS,
+                content=orjson.dumps(payload),
+                timeout=_OLLAMA_TIMEOUT,
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise self._map_http_error(e)
+        return self._parse_response(response)
+
+    async def _apost(self, payload: Dict[str, Any]) -> str:
+        try:
+            response = await self._aclient.post(
+                self.api_url,
+                headers=_JSON_HEADERS,
+                content=orjson.dumps(payload),
+                timeout=_OLLAMA_TIMEOUT,
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise self._map_http_error(e)
+        return self._parse_response(response)
+
+    @circuit_breaker
+    def send_request_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        payload = self._build_payload(messages)
+        payload["stream"] = True
+        try:
+            with self._client.stream(
+                "POST",
+                self.api_url,
+                headers=_JSON_HEADERS,
+                content=orjson.dumps(payload),
+                timeout=_OLLAMA_TIMEOUT,
+            ) as response:
+                if response.is_error:
+                    response.read()
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    text, done = self._stream_chunk(line, response.status_code)
+                    if text:
+                        yield text
+                    if done:
+                        break
+        except httpx.HTTPError as e:
+            raise self._map_http_error(e)
+        except ValueError as e:
+            raise self._stream_decode_error(e)
+        logger.debug("OllamaClient: потоковый ответ получен.")
+
+    @circuit_breaker
+    async def asend_request_stream(
+        self, messages: List[Dict[str, str]]
+    ) -> AsyncIterator[str]:
+        payload = self._build_payload(messages)
+        payload["stream"] = True
+        try:
+            async with self._aclient.stream(
+                "POST",
+                self.api_url,
+                headers=_JSON_HEADERS,
+                content=orjson.dumps(payload),
+                timeout=_OLLAMA_TIMEOUT,
+            ) as response:
+                if response.is_error:
+                    await response.aread()
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    text, done = self._stream_chunk(line, response.status_code)
+                    if text:
+                        yield text
+                    if done:
+                        break
+        except httpx.HTTPError as e:
+            raise self._map_http_error(e)
+        except ValueError as e:
+            raise self._stream_decode_error(e)
+        logger.debug("OllamaClient: потоковый ответ получен.")
+
+    def _stream_chunk(self, line: str, status_code: int) -> Tuple[Optional[str], bool]:
+        chunk = orjson.loads(line)
+        if "error" in chunk:
+            logger.error(f"OllamaClient: API вернуло ошибку: {chunk['error']}")
+            raise APIResponseError(
+                status_code=status_code,
+                message=f"Ollama API error: {chunk['error']}",
+            )
+        return chunk.get("response"), bool(chunk.get("done"))
+
+    def _stream_decode_error(self, e: ValueError) -> APIResponseError:
+        logger.error(f"OllamaClient: ошибка декодирования потока: {e}")
+        return APIResponseError(
+            status_code=0, message=f"Failed to decode Ollama stream chunk: {e}"
+        )
+
+    def _build_payload(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        logger.debug(
             f"OllamaClient: отправка запроса к {self.model_name} ({self.api_url}) с {len(messages)} сообщениями."
         )
-        logger.debug(f"OllamaClient: сообщения: {messages}")
+        logger.debug("OllamaClient: сообщения: {}", messages)
 
         system_prompt_content: Optional[str] = None
-        processed_messages = list(messages)
+        start = 0
 
-        if processed_messages and processed_messages[0]["role"] == "system":
-            system_prompt_content = processed_messages.pop(0)["content"]
+        if messages and messages[0]["role"] == "system":
+            system_prompt_content = messages[0]["content"]
+            start = 1
 
-        prompt_parts = []
-        for msg in processed_messages:
-            role = msg["role"].capitalize()
-            prompt_parts.append(f"{role}: {msg['content']}")
-
-        full_prompt = "\n".join(prompt_parts)
+        full_prompt = self._join_prompt(messages[start:])
 
         if not full_prompt and system_prompt_content:
 
@@ -40,37 +184,65 @@ class OllamaClient(BaseAPIClient):
             )
             full_prompt = "Hello"
 
-        payload = {
-            "model": self.model_name,
-            "prompt": full_prompt,
-            "stream": False,
-        }
+        payload = {**self._payload_base, "prompt": full_prompt}
 
         if system_prompt_content:
             payload["system"] = system_prompt_content
 
-        logger.debug(f"OllamaClient: payload: {payload}")
+        logger.debug("OllamaClient: payload: {}", payload)
+        return payload
 
-        try:
-            response = requests.post(self.api_url, json=payload, timeout=120)
-            response.raise_for_status()
-        except requests.exceptions.Timeout as e:
+    def _join_prompt(self, turns: List[Dict[str, str]]) -> str:
+        # Диалог растёт только в конец: переиспользуем строку предыдущего запроса
+        # и форматируем лишь новые реплики.
+        cached_turns, cached_prompt = self._prompt_cache
+        reused = len(cached_turns)
+        if reused and (
+            reused > len(turns) or any(a != b for a, b in zip(cached_turns, turns))
+        ):
+            reused, cached_prompt = 0, ""
+
+        new_parts = [
+            f"{msg['role'].capitalize()}: {msg['content']}" for msg in turns[reused:]
+        ]
+        if reused and new_parts:
+            full_prompt = cached_prompt + "\n" + "\n".join(new_parts)
+        elif reused:
+            full_prompt = cached_prompt
+        else:
+            full_prompt = "\n".join(new_parts)
+
+        self._prompt_cache = (list(turns), full_prompt)
+        return full_prompt
+
+    def _map_http_error(self, e: httpx.HTTPError) -> APIClientError:
+        # Ответ с ошибкой (404 — неизвестная модель, 400 …) — не сбой соединения:
+        # такие ошибки не размыкают предохранитель и не повторяются.
+        if isinstance(e, httpx.HTTPStatusError):
+            logger.error(
+                f"OllamaClient: ошибка HTTP статуса {e.response.status_code}: {e.response.text}"
+            )
+            return APIResponseError(
+                status_code=e.response.status_code, message=e.response.text
+            )
+        if isinstance(e, httpx.PoolTimeout):
+            logger.error(f"OllamaClient: нет свободного соединения в пуле: {e}")
+            return APIPoolTimeoutError(f"Ollama connection pool exhausted: {e}")
+        if isinstance(e, httpx.TimeoutException):
             logger.error(f"OllamaClient: таймаут при запросе к {self.api_url}: {e}")
-            raise APIConnectionError(
+            return APIConnectionError(
                 f"Timeout connecting to Ollama at {self.api_url}: {e}"
             )
-        except requests.exceptions.RequestException as e:
-            logger.error(f"OllamaClient: ошибка соединения с {self.api_url}: {e}")
-            raise APIConnectionError(
-                f"Error connecting to Ollama at {self.api_url}: {e}"
-            )
+        logger.error(f"OllamaClient: ошибка соединения с {self.api_url}: {e}")
+        return APIConnectionError(f"Error connecting to Ollama at {self.api_url}: {e}")
 
+    def _parse_response(self, response: httpx.Response) -> str:
         try:
-            data = response.json()
-            logger.debug(f"OllamaClient: получен ответ: {data}")
+            data = orjson.loads(response.content)
+            logger.debug("OllamaClient: получен ответ: {}", data)
 
             if "response" in data and data.get("response"):
-                logger.info("OllamaClient: успешный ответ получен.")
+                logger.debug("OllamaClient: успешный ответ получен.")
                 return str(data["response"]).strip()
             elif "error" in data:
                 error_msg = data["error"]
@@ -93,6 +265,8 @@ class OllamaClient(BaseAPIClient):
                 status_code=response.status_code,
                 message=f"Failed to decode JSON response from Ollama: {e}. Response text: {response.text[:200]}",
             )
+        except APIResponseError:
+            raise
         except Exception as e:
             logger.exception(
                 f"OllamaClient: непредвиденная ошибка при обработке ответа: {e}"
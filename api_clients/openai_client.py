@@ -1,88 +1,184 @@
-from typing import List, Dict
-from .base_client import BaseAPIClient
-from config import settings
+from typing import AsyncIterator, Iterator, List, Dict, Optional, Tuple
+from .base_client import (
+    BaseAPIClient,
+    CircuitBreaker,
+    SHARED_HTTPX,
+    cached_response,
+    circuit_breaker,
+    shared_async_httpx,
+    parse_retry_after,
+)
+from config import get_settings
 from exceptions import (
     InvalidAPIKeyError,
     APIConnectionError,
+    APIPoolTimeoutError,
     APIResponseError,
     APIClientError,
 )
 from loguru import logger
-import openai
+import httpx
+
+# SDK openai импортируется при создании первого клиента.
+openai = None
+
+
+def _ensure_openai():
+    global openai
+    if openai is None:
+        import openai as _openai
+
+        openai = _openai
+    return openai
 
 
 class OpenAIClient(BaseAPIClient):
+    _breaker = CircuitBreaker("OpenAIClient")
+
     def __init__(
-        self, api_key: str = settings.OPENAI_API_KEY, model: str = "gpt-3.5-turbo"
+        self,
+        api_key: Optional[str] = None,
+        model: str = "gpt-3.5-turbo",
+        cache_size: int = 0,
     ):
+        if api_key is None:
+            api_key = get_settings().OPENAI_API_KEY
         if not api_key:
             raise InvalidAPIKeyError(
                 "OpenAI API key not found. Set it in .env or pass it directly."
             )
-        super().__init__(api_key)
+        super().__init__(api_key, cache_size=cache_size)
         self.model = model
         try:
-            self.client = openai.OpenAI(api_key=self.api_key)
+            _ensure_openai()
+            # Повторы выполняет BaseAPIClient._retry, встроенные повторы SDK отключены.
+            self.client = openai.OpenAI(
+                api_key=self.api_key, http_client=SHARED_HTTPX, max_retries=0
+            )
         except Exception as e:
             logger.error(f"OpenAIClient: ошибка инициализации клиента OpenAI: {e}")
             raise APIClientError(f"Failed to initialize OpenAI client: {e}")
+        self._async_sdk: Optional[Tuple[httpx.AsyncClient, "openai.AsyncOpenAI"]] = None
 
+    @property
+    def aclient(self) -> "openai.AsyncOpenAI":
+        # Асинхронный SDK-клиент пересоздаётся вместе с пулом соединений текущего цикла.
+        http_client = shared_async_httpx()
+        if self._async_sdk is None or self._async_sdk[0] is not http_client:
+            self._async_sdk = (
+                http_client,
+                openai.AsyncOpenAI(
+                    api_key=self.api_key, http_client=http_client, max_retries=0
+                ),
+            )
+        return self._async_sdk[1]
+
+    @cached_response
+    @circuit_breaker
     def send_request(self, messages: List[Dict[str, str]]) -> str:
-        logger.info(
-            f"OpenAIClient: отправка запроса к {self.model} с {len(messages)} сообщениями."
-        )
-        logger.debug(f"OpenAIClient: сообщения: {messages}")
+        self._log_request(messages)
+        return self._retry(lambda: self._create(messages))
+
+    @cached_response
+    @circuit_breaker
+    async def asend_request(self, messages: List[Dict[str, str]]) -> str:
+        self._log_request(messages)
+        return await self._aretry(lambda: self._acreate(messages))
+
+    async def awarmup(self) -> None:
+        await self.aclient.models.list()
 
+    def _create(self, messages: List[Dict[str, str]]) -> str:
         try:
             response = self.client.chat.completions.create(
                 model=self.model, messages=messages
             )
-            if (
-                response.choices
-                and response.choices[0].message
-                and response.choices[0].message.content
-            ):
-                result = response.choices[0].message.content
-                logger.info("OpenAIClient: успешный ответ получен.")
-                return result
-            else:
-                logger.error(
-                    f"OpenAIClient: непредвиденная структура ответа: {response}"
-                )
-                raise APIResponseError(
-                    status_code=0,
-                    message=f"Непредвиденная структура ответа от OpenAI: {response}",
-                )
-
-        except openai.APIConnectionError as e:
+            return self._parse_response(response)
+        except Exception as e:
+            raise self._map_error(e)
+
+    async def _acreate(self, messages: List[Dict[str, str]]) -> str:
+        try:
+            response = await self.aclient.chat.completions.create(
+                model=self.model, messages=messages
+            )
+            return self._parse_response(response)
+        except Exception as e:
+            raise self._map_error(e)
+
+    @circuit_breaker
+    def send_request_stream(self, messages: List[Dict[str, str]]) -> Iterator[str]:
+        self._log_request(messages)
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model, messages=messages, stream=True
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            logger.debug("OpenAIClient: потоковый ответ получен.")
+        except Exception as e:
+            raise self._map_error(e)
+
+    @circuit_breaker
+    async def asend_request_stream(
+        self, messages: List[Dict[str, str]]
+    ) -> AsyncIterator[str]:
+        self._log_request(messages)
+        try:
+            stream = await self.aclient.chat.completions.create(
+                model=self.model, messages=messages, stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            logger.debug("OpenAIClient: потоковый ответ получен.")
+        except Exception as e:
+            raise self._map_error(e)
+
+    def _log_request(self, messages: List[Dict[str, str]]) -> None:
+        logger.debug(
+            f"OpenAIClient: отправка запроса к {self.model} с {len(messages)} сообщениями."
+        )
+        logger.debug("OpenAIClient: сообщения: {}", messages)
+
+    def _parse_response(self, response) -> str:
+        if (
+            response.choices
+            and response.choices[0].message
+            and response.choices[0].message.content
+        ):
+            result = response.choices[0].message.content
+            logger.debug("OpenAIClient: успешный ответ получен.")
+            return result
+        else:
+            logger.error(f"OpenAIClient: непредвиденная структура ответа: {response}")
+            raise APIResponseError(
+                status_code=0,
+                message=f"Непредвиденная структура ответа от OpenAI: {response}",
+            )
+
+    def _map_error(self, e: Exception) -> APIClientError:
+        if isinstance(e, openai.APIConnectionError) and isinstance(
+            e.__cause__, httpx.PoolTimeout
+        ):
+            logger.error(f"OpenAIClient: нет свободного соединения в пуле: {e}")
+            return APIPoolTimeoutError(f"OpenAI connection pool exhausted: {e}")
+        if isinstance(e, openai.APIConnectionError):
             logger.error(f"OpenAIClient: ошибка соединения: {e}")
-            raise APIConnectionError(f"OpenAI API connection error: {e}")
-        except openai.APIStatusError as e:
+            return APIConnectionError(f"OpenAI API connection error: {e}")
+        if isinstance(e, openai.APIStatusError):
             logger.error(
                 f"OpenAIClient: ошибка статуса API ({e.status_code}): {e.response.text if e.response else str(e)}"
             )
-            raise APIResponseError(
+            return APIResponseError(
                 status_code=e.status_code,
                 message=e.response.text if e.response else str(e.body or e.message),
-            )
-        except openai.RateLimitError as e:
-            logger.error(f"OpenAIClient: превышен лимит запросов: {e}")
-            raise APIResponseError(
-                status_code=e.status_code or 429, message=str(e.body or e.message)
-            )
-        except openai.AuthenticationError as e:
-            logger.error(f"OpenAIClient: ошибка аутентификации: {e}")
-            raise InvalidAPIKeyError(f"OpenAI API authentication error: {e}")
-        except Exception as e:
-            logger.exception("OpenAIClient: непредвиденная ошибка.")
-            if isinstance(
-                e,
-                (
-                    APIClientError,
-                    InvalidAPIKeyError,
-                    APIConnectionError,
-                    APIResponseError,
+                retry_after=parse_retry_after(
+                    e.response.headers.get("Retry-After") if e.response else None
                 ),
-            ):
-                raise
-            raise APIClientError(f"Unexpected error in OpenAI client: {e}")
+            )
+        logger.exception("OpenAIClient: непредвиденная ошибка.")
+        if isinstance(e, APIClientError):
+            return e
+        return APIClientError(f"Unexpected error in OpenAI client: {e}")
@@ -1,27 +1,45 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
 
 
 class Settings(BaseSettings):
-    OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "your_openai_api_key")
-    DEEPSEEK_API_KEY: str = os.getenv("DEEPSEEK_API_KEY", "your_deepseek_api_key")
-    GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "your_gemini_api_key")
-    OLLAMA_API_URL: str = os.getenv("OLLAMA_API_URL", "http://localhost:11434")
+    OPENAI_API_KEY: str = "your_openai_api_key"
+    DEEPSEEK_API_KEY: str = "your_deepseek_api_key"
+    GEMINI_API_KEY: str = "your_gemini_api_key"
+    OLLAMA_API_URL: str = "http://localhost:11434"
     DEFAULT_SYSTEM_PROMPT: str = (
-        os.getenv("DEFAULT_SYSTEM_PROMPT", 
-                  "ты анализатор который помогает сопоставлять спортивные мероприятия. "
-                  "тебе нужно возвращать ответ в таком формате: {respone: 0.23} "
-                  "c оценкой совпадения от 0.00 до 1.00"
-                  )
+        "ты анализатор который помогает сопоставлять спортивные мероприятия. "
+        "тебе нужно возвращать ответ в таком формате: {respone: 0.23} "
+        "c оценкой совпадения от 0.00 до 1.00"
     )
+    CACHE_ENABLED: bool = False
+    CACHE_TTL: int = 3600
+    CACHE_MAXSIZE: int = 10_000
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92
+    MAX_MESSAGE_CHARS: int = 100_000
+    MAX_MESSAGES: int = 500
+    THREADPOOL_SIZE: int = 200
+    WARMUP_CLIENTS: bool = True
+    ADMIN_TOKEN: str = ""
+    DEV: bool = False
+    LOG_FILE: str = "api_server.log"
+    WORKERS: int = 1
 
     model_config = SettingsConfigDict(
         env_file=".env", env_file_encoding="utf-8", extra="ignore"
     )
 
 
-settings = Settings()
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Настройки читаются из окружения и .env при первом обращении."""
+    return Settings()
+
+
+def __getattr__(name: str):
+    # Совместимость с `from config import settings`.
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,9 +1,29 @@
-from typing import List, Dict, Optional, Literal
+import sys
+from typing import Iterable, List, Dict, Optional, Literal, Tuple
+import xxhash
+
+
+def chain_hash(prev: bytes, role: str, content: str) -> bytes:
+    """Следующее звено цепочки хэшей префикса разговора (некриптографический xxh3-128)."""
+    hasher = xxhash.xxh3_128(prev)
+    hasher.update(role.encode())
+    hasher.update(b"\x00")
+    hasher.update(content.encode())
+    return hasher.digest()
+
+
+def messages_hash(messages: Iterable[Dict[str, str]]) -> bytes:
+    """Хэш списка сообщений; совпадает с ConversationContext.context_hash()."""
+    digest = b""
+    for msg in messages:
+        digest = chain_hash(digest, msg["role"], msg["content"])
+    return digest
 
 
 class ConversationContext:
     def __init__(self, system_prompt: Optional[str] = None):
         self.messages: List[Dict[str, str]] = []
+        self._prefix_hashes: List[bytes] = []
         if system_prompt:
             self.add_message("system", system_prompt)
 
@@ -14,27 +34,45 @@ class ConversationContext:
             role: Роль сообщения ("system", "user", или "assistant")
             content: Текст сообщения
         """
+        role = sys.intern(role)
         self.messages.append({"role": role, "content": content})
+        self._prefix_hashes.append(chain_hash(self.context_hash(), role, content))
 
-    def get_context(self, depth: Optional[int] = None) -> List[Dict[str, str]]:
-        if depth is None or depth <= 0:
-            return list(self.messages)
+    def context_hash(self) -> bytes:
+        """Хэш всей истории (depth=None); пустая строка байт для пустого контекста."""
+        return self._prefix_hashes[-1] if self._prefix_hashes else b""
 
-        actual_messages = list(self.messages)
-        system_message = None
-        if actual_messages and actual_messages[0]["role"] == "system":
-            system_message = actual_messages.pop(0)
+    def prefix_hash(self, length: int) -> bytes:
+        """Хэш первых `length` сообщений."""
+        return self._prefix_hashes[length - 1] if length > 0 else b""
 
-        start_index = max(0, len(actual_messages) - depth)
-        limited_messages = actual_messages[start_index:]
+    def get_cacheable_prefix(self) -> Tuple[List[Dict[str, str]], bytes]:
+        """Возвращает стабильный префикс (до последнего ответа ассистента) и его хэш."""
+        for index in range(len(self.messages) - 1, -1, -1):
+            if self.messages[index]["role"] == "assistant":
+                return self.messages[: index + 1], self._prefix_hashes[index]
+        return [], b""
+
+    def get_context(
+        self, depth: Optional[int] = None, copy: bool = True
+    ) -> List[Dict[str, str]]:
+        """Возвращает последние `depth` сообщений (системное сохраняется).
+
+        При copy=False и полном контексте возвращается внутренний список без копии:
+        вызывающий код не должен его изменять.
+        """
+        messages = self.messages
+        if depth is None or depth <= 0 or (not copy and len(messages) <= depth):
+            return messages[:] if copy else messages
 
-        if system_message:
-            return [system_message] + limited_messages
-        return limited_messages
+        if messages and messages[0]["role"] == "system":
+            return [messages[0]] + messages[max(1, len(messages) - depth):]
+        return messages[max(0, len(messages) - depth):]
 
     def clear_context(self, keep_system_prompt: bool = True):
         if keep_system_prompt and self.messages and self.messages[0]["role"] == "system":
-            system_prompt_content = self.messages[0]["content"]
-            self.messages = [{"role": "system", "content": system_prompt_content}]
+            del self.messages[1:]
+            del self._prefix_hashes[1:]
         else:
-            self.messages = []
+            self.messages.clear()
+            self._prefix_hashes.clear()
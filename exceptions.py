@@ -1,3 +1,6 @@
+from typing import Optional
+
+
 class APIClientError(Exception):
     """Base exception for API client errors."""
 
@@ -10,11 +13,20 @@ class APIConnectionError(APIClientError):
     pass
 
 
+class APIPoolTimeoutError(APIConnectionError):
+    """Raised when no pooled connection frees up in time (local overload, not an outage)."""
+
+    pass
+
+
 class APIResponseError(APIClientError):
     """Raised when the API returns an unexpected or error response."""
 
-    def __init__(self, status_code: int, message: str):
+    def __init__(
+        self, status_code: int, message: str, retry_after: Optional[float] = None
+    ):
         self.status_code = status_code
+        self.retry_after = retry_after
         super().__init__(f"API Error {status_code}: {message}")
 
 
@@ -0,0 +1,11 @@
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+worker_class = "uvicorn_worker.UvicornWorker"
+keepalive = 65
+timeout = 120
+
+# Воркеры не пишут в общий файл логов: ротация из нескольких процессов
+# конфликтует, поэтому логи идут в консоль (stderr, его собирает gunicorn/Docker).
+os.environ.setdefault("LOG_FILE", "")
@@ -1,16 +1,44 @@
-from fastapi import FastAPI, HTTPException, Body
+import asyncio
+import functools
+import inspect
+import secrets
+import anyio.to_thread
+from fastapi import FastAPI, HTTPException, Body, Header
 from fastapi.concurrency import run_in_threadpool
-from pydantic import BaseModel, Field
-from typing import List, Dict, Optional, Literal
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints
+from typing import (
+    Annotated,
+    AsyncIterator,
+    Callable,
+    Iterable,
+    List,
+    Dict,
+    Optional,
+    Literal,
+    Tuple,
+)
+import orjson
 import uvicorn
+from cachetools import TTLCache
 
-from api_clients.base_client import BaseAPIClient
+from api_clients.base_client import (
+    BaseAPIClient,
+    close_shared_async_httpx,
+)
 from api_clients.openai_client import OpenAIClient
 from api_clients.deepseek_client import DeepSeekClient
 from api_clients.gemini_client import GeminiClient
 from api_clients.ollama_client import OllamaClient
-from context_manager import ConversationContext
-from config import settings
+from context_manager import ConversationContext, chain_hash, messages_hash
+from response_cache import (
+    CacheBackend,
+    InMemoryCache,
+    SemanticCache,
+    make_cache_key,
+    make_context_hash,
+)
+from config import Settings, get_settings
 from exceptions import (
     APIClientError,
     InvalidAPIKeyError,
@@ -21,8 +49,25 @@ from loguru import logger
 import sys
 
 logger.remove()
-logger.add(sys.stderr, level="INFO")
-logger.add("api_server.log", rotation="10 MB", retention="7 days", level="DEBUG")
+# Файл ротируется одним процессом: при нескольких процессах (WORKERS > 1 или
+# gunicorn, который очищает LOG_FILE) полный лог идёт в консоль.
+log_to_file = bool(get_settings().LOG_FILE) and get_settings().WORKERS == 1
+# В production в консоль идут только предупреждения и ошибки, полный лог — в файл.
+logger.add(
+    sys.stderr,
+    level="INFO" if get_settings().DEV or not log_to_file else "WARNING",
+)
+if log_to_file:
+    # Запись в файл идёт из фонового потока (enqueue), строки — JSON (serialize).
+    # DEBUG (сообщения о каждом запросе с полным содержимым) пишется только при DEV.
+    logger.add(
+        get_settings().LOG_FILE,
+        rotation="10 MB",
+        retention="7 days",
+        level="DEBUG" if get_settings().DEV else "INFO",
+        enqueue=True,
+        serialize=True,
+    )
 
 app = FastAPI(
     title="AI Chat API",
@@ -30,10 +75,32 @@ app = FastAPI(
     version="1.0.0",
 )
 
+response_cache: CacheBackend = InMemoryCache(
+    maxsize=get_settings().CACHE_MAXSIZE, ttl=get_settings().CACHE_TTL
+)
+semantic_cache: Optional[SemanticCache] = None
+
+# Недавние 401/404 (неверный ключ или модель) по паре тип клиента + модель: пока
+# запись жива, такие запросы отклоняются сразу, без обращения к провайдеру.
+NEGATIVE_CACHE_STATUSES = frozenset({401, 404})
+provider_failures: TTLCache = TTLCache(maxsize=1024, ttl=30)
+
+# Одинаковые запросы (тот же ключ, что у кэша ответов), пришедшие одновременно,
+# ждут один вызов провайдера вместо отдельного вызова на каждый.
+inflight_requests: Dict[str, "asyncio.Task[str]"] = {}
+
+NO_USER_MESSAGE_DETAIL = "Запрос должен содержать хотя бы одно сообщение от пользователя."
+
+MessageText = Annotated[
+    str, StringConstraints(max_length=get_settings().MAX_MESSAGE_CHARS)
+]
+
 
 class ChatMessageInput(BaseModel):
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     role: Literal["user", "assistant", "system"]
-    content: str
+    content: MessageText
 
 
 class ChatRequest(BaseModel):
@@ -41,12 +108,14 @@ class ChatRequest(BaseModel):
         ..., description="Тип клиента для использования."
     )
     messages: List[ChatMessageInput] = Field(
-        ..., description="Список сообщений в диалоге."
+        ...,
+        max_length=get_settings().MAX_MESSAGES,
+        description="Список сообщений в диалоге.",
     )
     model_name_override: Optional[str] = Field(
         None, description="Имя модели для переопределения (для Gemini, Ollama)."
     )
-    system_prompt_override: Optional[str] = Field(
+    system_prompt_override: Optional[MessageText] = Field(
         None,
         description="Системное сообщение для переопределения настроек по умолчанию.",
     )
@@ -65,33 +134,100 @@ class ErrorDetail(BaseModel):
     detail: str
 
 
+class ResetResponse(BaseModel):
+    status: str
+
+
+@app.on_event("startup")
+async def configure_threadpool():
+    # Лимит AnyIO по умолчанию — 40 потоков на все run_in_threadpool и sync-обработчики.
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = get_settings().THREADPOOL_SIZE
+
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    # Пул соединений создаётся клиентами при первом запросе в event loop приложения
+    # (shared_async_httpx) и закрывается при остановке.
+    await close_shared_async_httpx()
+
+
+@app.on_event("startup")
+async def load_semantic_cache():
+    global semantic_cache
+    settings = get_settings()
+    if not settings.SEMANTIC_CACHE_ENABLED:
+        return
+    try:
+        semantic_cache = await run_in_threadpool(
+            SemanticCache,
+            settings.SEMANTIC_CACHE_MODEL,
+            threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+            maxsize=settings.CACHE_MAXSIZE,
+        )
+        logger.info(
+            f"API: Семантический кэш включён, модель {settings.SEMANTIC_CACHE_MODEL}."
+        )
+    except Exception as e:
+        logger.error(f"API: Не удалось включить семантический кэш: {e}")
+
+
+def canonicalize(
+    turns: Iterable[ChatMessageInput], system_prompt: Optional[str]
+) -> ConversationContext:
+    """Собирает контекст в каноническом порядке [system?, *реплики].
+
+    Префикс диалога остаётся побайтно одинаковым от запроса к запросу, что нужно
+    для кэширования промпта на стороне провайдера. Системные сообщения из `turns`
+    пропускаются: системный промпт передаётся отдельно.
+    """
+    context = ConversationContext()
+    if system_prompt:
+        context.add_message("system", system_prompt)
+    for turn in turns:
+        if turn.role != "system":
+            context.add_message(turn.role, turn.content)
+    return context
+
+
 def get_api_client(
     client_type: str, model_name_override: Optional[str] = None
+) -> BaseAPIClient:
+    client_type = client_type.strip().lower()
+    if model_name_override is not None:
+        model_name_override = model_name_override.strip() or None
+    return _create_api_client(client_type, model_name_override)
+
+
+CLIENT_REGISTRY: Dict[str, Callable[..., BaseAPIClient]] = {
+    "openai": OpenAIClient,
+    "deepseek": DeepSeekClient,
+    "gemini": GeminiClient,
+    "ollama": OllamaClient,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _accepts_model_name(ctor: Callable[..., BaseAPIClient]) -> bool:
+    return "model_name" in inspect.signature(ctor).parameters
+
+
+@functools.lru_cache(maxsize=32)
+def _create_api_client(
+    client_type: str, model_name_override: Optional[str] = None
 ) -> BaseAPIClient:
     logger.info(
         f"API: Попытка создать клиента: {client_type}, модель: {model_name_override}"
     )
-    client_type = client_type.strip().lower()
 
+    ctor = CLIENT_REGISTRY.get(client_type)
+    if ctor is None:
+        logger.error(f"API: Неизвестный тип клиента: {client_type}")
+        raise APIClientError(f"Неизвестный тип клиента: {client_type}")
     try:
-        if client_type == "openai":
-            return OpenAIClient()
-        elif client_type == "deepseek":
-            return DeepSeekClient()
-        elif client_type == "gemini":
-            return (
-                GeminiClient(model_name=model_name_override)
-                if model_name_override
-                else GeminiClient()
-            )
-        elif client_type == "ollama":
-            return (
-                OllamaClient(model_name=model_name_override)
-                if model_name_override
-                else OllamaClient()
-            )
-        else:
-            raise ValueError(f"Неизвестный тип клиента: {client_type}")
+        if model_name_override and _accepts_model_name(ctor):
+            return ctor(model_name=model_name_override)
+        return ctor()
     except InvalidAPIKeyError as e:
         logger.error(f"API: Ошибка API ключа для клиента {client_type}: {e}")
         raise
@@ -105,34 +241,77 @@ def get_api_client(
         raise APIClientError(f"Не удалось создать клиент {client_type}: {e}")
 
 
-@app.post(
-    "/api/v1/chat",
-    response_model=ChatResponse,
-    responses={
-        400: {"model": ErrorDetail, "description": "Некорректный запрос"},
-        401: {"model": ErrorDetail, "description": "Ошибка API ключа"},
-        404: {
-            "model": ErrorDetail,
-            "description": "Модель не найдена или не поддерживается",
-        },
-        500: {"model": ErrorDetail, "description": "Внутренняя ошибка сервера"},
-        503: {
-            "model": ErrorDetail,
-            "description": "Ошибка соединения с API провайдера",
-        },
-    },
-)
-async def handle_chat_request(request: ChatRequest = Body(...)):
-    logger.info(f"API: Получен запрос для клиента: {request.client_type}")
-    logger.debug(f"API: Входящий запрос: {request.model_dump_json(indent=2)}")
+CLIENT_WARMUP_TIMEOUT = 2.0
+# Настройка с ключом API для каждого типа клиента; Ollama ключа не требует.
+CLIENT_API_KEY_SETTINGS = {
+    "openai": "OPENAI_API_KEY",
+    "deepseek": "DEEPSEEK_API_KEY",
+    "gemini": "GEMINI_API_KEY",
+}
+
+
+def _has_configured_key(client_type: str) -> bool:
+    key_setting = CLIENT_API_KEY_SETTINGS.get(client_type)
+    if key_setting is None:
+        return True
+    value = getattr(get_settings(), key_setting)
+    return bool(value) and value != Settings.model_fields[key_setting].default
+
+
+@app.on_event("startup")
+async def warm_up_clients():
+    # Клиенты по умолчанию создаются заранее и попадают в кэш _create_api_client,
+    # а соединения с провайдерами открываются до первого запроса. Провайдеры без
+    # настроенного ключа (пустого или из примера) пропускаются: их SDK не импортируется.
+    if not get_settings().WARMUP_CLIENTS:
+        return
+    await asyncio.gather(
+        *(_warm_up_client(t) for t in CLIENT_REGISTRY if _has_configured_key(t))
+    )
 
+
+async def _warm_up_client(client_type: str) -> None:
+    async def warm_up() -> None:
+        api_client = await run_in_threadpool(get_api_client, client_type)
+        await api_client.awarmup()
+
+    try:
+        await asyncio.wait_for(warm_up(), timeout=CLIENT_WARMUP_TIMEOUT)
+        logger.info(f"API: Клиент {client_type} прогрет.")
+    except Exception as e:
+        logger.info(f"API: Клиент {client_type} не прогрет: {e!r}")
+
+
+@app.post("/api/v1/admin/reset-clients", response_model=ResetResponse)
+async def reset_api_clients(x_admin_token: Optional[str] = Header(None)):
+    """Сбрасывает созданные клиенты и перечитывает настройки (после изменения .env).
+
+    Действует только на процесс, принявший запрос; без ADMIN_TOKEN эндпоинт отключён.
+    """
+    admin_token = get_settings().ADMIN_TOKEN
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not secrets.compare_digest(
+        x_admin_token.encode(), admin_token.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Неверный токен администратора.")
+    _create_api_client.cache_clear()
+    provider_failures.clear()
+    get_settings.cache_clear()
+    logger.info("API: Кэш клиентов и настроек сброшен.")
+    return ResetResponse(status="ok")
+
+
+def resolve_api_client(request: ChatRequest) -> BaseAPIClient:
     try:
-        api_client = get_api_client(request.client_type, request.model_name_override)
+        return get_api_client(request.client_type, request.model_name_override)
     except InvalidAPIKeyError as e:
-        raise HTTPException(status_code=401, detail=str(e))
+        raise remember_failure(request, HTTPException(status_code=401, detail=str(e)))
     except APIClientError as e:
         if "not found" in str(e).lower() or "404" in str(e):
-            raise HTTPException(status_code=404, detail=str(e))
+            raise remember_failure(
+                request, HTTPException(status_code=404, detail=str(e))
+            )
         raise HTTPException(
             status_code=400, detail=f"Ошибка конфигурации клиента: {str(e)}"
         )
@@ -143,98 +322,197 @@ async def handle_chat_request(request: ChatRequest = Body(...)):
             detail=f"Внутренняя ошибка при инициализации клиента: {str(e)}",
         )
 
-    system_prompt_to_use: Optional[str] = None
-    input_messages: List[Dict[str, str]] = []
 
-    if request.system_prompt_override is not None:
-        system_prompt_to_use = request.system_prompt_override
-        for msg in request.messages:
-            if msg.role != "system":
-                input_messages.append({"role": msg.role, "content": msg.content})
-    else:
+def _failure_key(request: ChatRequest) -> Tuple[str, Optional[str]]:
+    return request.client_type, (request.model_name_override or "").strip() or None
 
-        found_system_in_messages = False
-        for msg in request.messages:
-            if msg.role == "system":
-                if not found_system_in_messages:
-                    system_prompt_to_use = msg.content
-                    found_system_in_messages = True
-                else:
-                    logger.warning(
-                        "API: Найдено несколько системных сообщений во входящем списке, используется первое."
-                    )
-            else:
-                input_messages.append({"role": msg.role, "content": msg.content})
-
-        if not found_system_in_messages:
-            system_prompt_to_use = settings.DEFAULT_SYSTEM_PROMPT
-
-    if (
-        not input_messages
-        and system_prompt_to_use is not None
-        and not system_prompt_to_use.strip()
-    ):
 
-        pass
+def check_recent_failure(request: ChatRequest) -> None:
+    failure = provider_failures.get(_failure_key(request))
+    if failure is not None:
+        logger.debug(f"API: Повтор недавней ошибки {failure[0]} без запроса к провайдеру.")
+        raise HTTPException(status_code=failure[0], detail=failure[1])
 
-    context = ConversationContext()
-    if system_prompt_to_use and system_prompt_to_use.strip():
-        context.add_message("system", system_prompt_to_use)
-        logger.info(
+
+def remember_failure(request: ChatRequest, error: HTTPException) -> HTTPException:
+    if error.status_code in NEGATIVE_CACHE_STATUSES:
+        provider_failures[_failure_key(request)] = (error.status_code, error.detail)
+    return error
+
+
+def build_request_context(
+    request: ChatRequest,
+) -> Tuple[List[Dict[str, str]], bytes, bytes]:
+    """Возвращает контекст запроса с учётом context_depth и хэши его цепочки.
+
+    Второй элемент — хэш всего контекста, третий — хэш без последнего сообщения.
+    Без обрезки оба берутся из ConversationContext без повторного хэширования.
+    """
+    system_prompt_to_use: Optional[str] = request.system_prompt_override
+    if system_prompt_to_use is None:
+        system_contents = (m.content for m in request.messages if m.role == "system")
+        system_prompt_to_use = next(system_contents, None)
+        if system_prompt_to_use is None:
+            system_prompt_to_use = get_settings().DEFAULT_SYSTEM_PROMPT
+        elif next(system_contents, None) is not None:
+            logger.warning(
+                "API: Найдено несколько системных сообщений во входящем списке, используется первое."
+            )
+
+    if system_prompt_to_use:
+        system_prompt_to_use = system_prompt_to_use.strip()
+    if system_prompt_to_use:
+        logger.debug(
             f"API: Используется системное сообщение: '{system_prompt_to_use[:100]}...'"
         )
     else:
-        logger.info("API: Системное сообщение не используется или пустое.")
+        logger.debug("API: Системное сообщение не используется или пустое.")
 
-    for msg_data in input_messages:
-        context.add_message(msg_data["role"], msg_data["content"])
+    context = canonicalize(request.messages, system_prompt_to_use)
 
-    current_context_for_api = context.get_context(depth=request.context_depth)
+    current_context_for_api = context.get_context(
+        depth=request.context_depth, copy=False
+    )
 
+    # Защитная проверка: реплики пользователя уже проверены до сборки контекста.
     if not current_context_for_api or all(
         m["role"] == "system" for m in current_context_for_api
     ):
-
         logger.warning(
             "API: Контекст для API пуст или содержит только системное сообщение после обработки."
         )
+        raise HTTPException(status_code=400, detail=NO_USER_MESSAGE_DETAIL)
+
+    if current_context_for_api is context.messages:
+        prior_hash = context.prefix_hash(len(current_context_for_api) - 1)
+        full_hash = context.context_hash()
+    else:
+        last = current_context_for_api[-1]
+        prior_hash = messages_hash(current_context_for_api[:-1])
+        full_hash = chain_hash(prior_hash, last["role"], last["content"])
+    return current_context_for_api, full_hash, prior_hash
+
+
+def provider_http_error(request: ChatRequest, e: APIClientError) -> HTTPException:
+    if isinstance(e, APIConnectionError):
+        logger.error(f"API: Ошибка соединения с API провайдера: {e}")
+        return HTTPException(status_code=503, detail=str(e))
+    logger.error(f"API: Ошибка ответа от API провайдера: {e}")
+    status_code = 500
+    if hasattr(e, "status_code") and isinstance(e.status_code, int):
+        if e.status_code == 401 or e.status_code == 403:
+            status_code = 401
+        elif e.status_code == 404:
+            status_code = 404
+        elif e.status_code == 429:
+            status_code = 429
+        elif 400 <= e.status_code < 500:
+            status_code = 400
+    return remember_failure(
+        request, HTTPException(status_code=status_code, detail=str(e))
+    )
+
+
+CHAT_ERROR_RESPONSES = {
+    400: {"model": ErrorDetail, "description": "Некорректный запрос"},
+    401: {"model": ErrorDetail, "description": "Ошибка API ключа"},
+    404: {
+        "model": ErrorDetail,
+        "description": "Модель не найдена или не поддерживается",
+    },
+    500: {"model": ErrorDetail, "description": "Внутренняя ошибка сервера"},
+    503: {
+        "model": ErrorDetail,
+        "description": "Ошибка соединения с API провайдера",
+    },
+}
 
-        if not any(m["role"] == "user" for m in current_context_for_api):
-            raise HTTPException(
-                status_code=400,
-                detail="Запрос должен содержать хотя бы одно сообщение от пользователя.",
+
+@app.post(
+    "/api/v1/chat",
+    response_model=ChatResponse,
+    responses=CHAT_ERROR_RESPONSES,
+)
+async def handle_chat_request(request: ChatRequest = Body(...)):
+    logger.debug(f"API: Получен запрос для клиента: {request.client_type}")
+    logger.opt(lazy=True).debug(
+        "API: Входящий запрос: {}", lambda: request.model_dump_json()
+    )
+
+    if not any(m.role == "user" for m in request.messages):
+        raise HTTPException(status_code=400, detail=NO_USER_MESSAGE_DETAIL)
+
+    check_recent_failure(request)
+    api_client = resolve_api_client(request)
+    current_context_for_api, context_hash, prior_hash = build_request_context(request)
+
+    model_used = getattr(api_client, "model_name", None)
+    model_key = model_used or getattr(api_client, "model", None)
+    logger.opt(lazy=True).debug(
+        "API: Контекст {}, сообщений: {}.",
+        lambda: context_hash.hex()[:12],
+        lambda: len(current_context_for_api),
+    )
+    request_key = make_cache_key(request.client_type, model_key, context_hash)
+    cache_key: Optional[str] = None
+    if get_settings().CACHE_ENABLED:
+        cache_key = request_key
+        cached_text = await response_cache.get(cache_key)
+        if cached_text is not None:
+            logger.debug("API: Ответ взят из кэша.")
+            return ChatResponse(
+                assistant_response=cached_text,
+                client_used=request.client_type,
+                model_used=model_used,
             )
 
-    try:
-        logger.info(
-            f"API: Отправка запроса к {api_client.model_name if hasattr(api_client, 'model_name') else request.client_type}"
+    semantic_vector = None
+    prior_context_hash: Optional[bytes] = None
+    if semantic_cache is not None and current_context_for_api[-1]["role"] == "user":
+        prior_context_hash = make_context_hash(
+            request.client_type, model_key, prior_hash
         )
-        response_text = await run_in_threadpool(
-            api_client.send_request, current_context_for_api
+        semantic_vector = await run_in_threadpool(
+            semantic_cache.embed, current_context_for_api[-1]["content"]
         )
+        cached_text = semantic_cache.lookup(semantic_vector, prior_context_hash)
+        if cached_text is not None:
+            logger.debug("API: Ответ взят из семантического кэша.")
+            return ChatResponse(
+                assistant_response=cached_text,
+                client_used=request.client_type,
+                model_used=model_used,
+            )
 
-        logger.info(f"API: Ответ от ассистента получен.")
+    async def fetch() -> str:
+        logger.debug(
+            f"API: Отправка запроса к {api_client.model_name if hasattr(api_client, 'model_name') else request.client_type}"
+        )
+        response_text = await api_client.asend_request(current_context_for_api)
+        if cache_key is not None:
+            await response_cache.set(cache_key, response_text)
+        if semantic_vector is not None:
+            semantic_cache.add(semantic_vector, prior_context_hash, response_text)
+        logger.debug("API: Ответ от ассистента получен.")
+        return response_text
+
+    try:
+        task = inflight_requests.get(request_key)
+        if task is None:
+            task = asyncio.create_task(fetch())
+            inflight_requests[request_key] = task
+            task.add_done_callback(functools.partial(_forget_inflight, request_key))
+        else:
+            logger.debug("API: Такой же запрос уже выполняется, ожидаем его ответ.")
+        # shield: отключение одного клиента не отменяет общий вызов для остальных.
+        response_text = await asyncio.shield(task)
         return ChatResponse(
             assistant_response=response_text,
             client_used=request.client_type,
-            model_used=getattr(api_client, "model_name", None),
+            model_used=model_used,
         )
-    except APIResponseError as e:
-        logger.error(f"API: Ошибка ответа от API провайдера: {e}")
-        status_code = 500
-        if hasattr(e, "status_code") and isinstance(e.status_code, int):
-            if e.status_code == 401 or e.status_code == 403:
-                status_code = 401
-            elif e.status_code == 404:
-                status_code = 404
-            elif e.status_code == 429:
-                status_code = 429
-            elif 400 <= e.status_code < 500:
-                status_code = 400
-        raise HTTPException(status_code=status_code, detail=str(e))
-    except APIConnectionError as e:
-        logger.error(f"API: Ошибка соединения с API провайдера: {e}")
-        raise HTTPException(status_code=503, detail=str(e))
+    except (APIResponseError, APIConnectionError) as e:
+        raise provider_http_error(request, e)
     except Exception as e:
         logger.exception("API: Непредвиденная внутренняя ошибка при обработке запроса.")
         raise HTTPException(
@@ -242,12 +520,99 @@ async def handle_chat_request(request: ChatRequest = Body(...)):
         )
 
 
+def _forget_inflight(request_key: str, task: "asyncio.Task[str]") -> None:
+    inflight_requests.pop(request_key, None)
+    if not task.cancelled():
+        # Исключение забирается здесь на случай, если все ожидающие запросы отменены.
+        task.exception()
+
+
+def sse_event(payload: Dict[str, str], event: Optional[str] = None) -> bytes:
+    frame = b"data: " + orjson.dumps(payload) + b"\n\n"
+    return b"event: " + event.encode() + b"\n" + frame if event else frame
+
+
+async def sse_stream(
+    first_chunk: Optional[str], chunks: AsyncIterator[str]
+) -> AsyncIterator[bytes]:
+    try:
+        if first_chunk is not None:
+            yield sse_event({"delta": first_chunk})
+        async for chunk in chunks:
+            yield sse_event({"delta": chunk})
+        yield b"data: [DONE]\n\n"
+    except APIClientError as e:
+        # Заголовки уже отправлены: ошибку можно передать только событием потока.
+        logger.error(f"API: Ошибка потока от API провайдера: {e}")
+        yield sse_event({"detail": str(e)}, event="error")
+    finally:
+        await chunks.aclose()
+
+
+@app.post(
+    "/api/v1/chat/stream",
+    response_class=StreamingResponse,
+    responses=CHAT_ERROR_RESPONSES,
+)
+async def handle_chat_stream_request(request: ChatRequest = Body(...)):
+    """Отдаёт ответ по мере генерации в формате Server-Sent Events.
+
+    Каждый фрагмент — `data: {"delta": "..."}`, конец потока — `data: [DONE]`,
+    ошибка посреди потока — событие `error` с `{"detail": "..."}`. Кэш не используется.
+    """
+    logger.debug(f"API: Получен потоковый запрос для клиента: {request.client_type}")
+
+    if not any(m.role == "user" for m in request.messages):
+        raise HTTPException(status_code=400, detail=NO_USER_MESSAGE_DETAIL)
+
+    check_recent_failure(request)
+    api_client = resolve_api_client(request)
+    current_context_for_api, _, _ = build_request_context(request)
+
+    chunks = api_client.asend_request_stream(current_context_for_api)
+    # Первый фрагмент читаем до отправки заголовков, чтобы ошибки ключа, модели
+    # или открытого предохранителя вернулись обычным HTTP-статусом.
+    try:
+        first_chunk = await anext(chunks, None)
+    except (APIResponseError, APIConnectionError) as e:
+        raise provider_http_error(request, e)
+    except Exception as e:
+        logger.exception("API: Непредвиденная ошибка при запуске потока.")
+        raise HTTPException(
+            status_code=500, detail=f"Внутренняя ошибка сервера: {str(e)}"
+        )
+
+    return StreamingResponse(
+        sse_stream(first_chunk, chunks),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def uvicorn_options() -> Dict[str, object]:
+    dev = get_settings().DEV
+    return {
+        "host": "0.0.0.0",
+        "port": 8000,
+        # "auto" берёт uvloop/httptools, если они установлены (uvicorn[standard]),
+        # и стандартные asyncio/h11 там, где их нет (Windows, PyPy).
+        "loop": "auto",
+        "http": "auto",
+        "access_log": dev,
+        "log_level": "info" if dev else "warning",
+    }
+
+
 async def main_async():
-    config = uvicorn.Config("api_server:app", host="0.0.0.0", port=8000, reload=True)
+    config = uvicorn.Config("main:app", **uvicorn_options())
     server = uvicorn.Server(config)
     await server.serve()
 
 
 if __name__ == "__main__":
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if not get_settings().DEV:
+        logger.warning(
+            "API: Для production запускайте сервер через gunicorn -c gunicorn_conf.py main:app"
+        )
+    uvicorn.run("main:app", workers=get_settings().WORKERS, **uvicorn_options())
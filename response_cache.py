@@ -0,0 +1,108 @@
+import asyncio
+import threading
+from typing import List, Optional, Protocol, Tuple
+import xxhash
+from cachetools import TTLCache
+
+
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> Optional[str]: ...
+
+    async def set(self, key: str, value: str) -> None: ...
+
+    async def clear(self) -> None: ...
+
+
+class InMemoryCache:
+    """LRU-кэш ответов с TTL в памяти процесса."""
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 3600):
+        self._cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = asyncio.Lock()
+
+    async def get(self, key: str) -> Optional[str]:
+        async with self._lock:
+            return self._cache.get(key)
+
+    async def set(self, key: str, value: str) -> None:
+        async with self._lock:
+            self._cache[key] = value
+
+    async def clear(self) -> None:
+        async with self._lock:
+            self._cache.clear()
+
+
+def make_context_hash(
+    client_type: str, model_name: Optional[str], chain_hash: bytes
+) -> bytes:
+    """Хэш контекста (ConversationContext.context_hash()) с привязкой к клиенту и модели."""
+    hasher = xxhash.xxh3_128(client_type.encode())
+    hasher.update(b"\x00")
+    hasher.update((model_name or "").encode())
+    hasher.update(b"\x00")
+    hasher.update(chain_hash)
+    return hasher.digest()
+
+
+def make_cache_key(
+    client_type: str, model_name: Optional[str], chain_hash: bytes
+) -> str:
+    """Ключ точного кэша; hex-строка подходит и для внешних хранилищ (Redis)."""
+    return make_context_hash(client_type, model_name, chain_hash).hex()
+
+
+class SemanticCache:
+    """Семантический кэш в стиле MeanCache.
+
+    Последнее сообщение пользователя векторизуется локальной моделью
+    sentence-transformers и ищется в FAISS (IndexFlatIP по нормированным векторам).
+    Попадание засчитывается только при совпадении хэша предшествующего контекста,
+    чтобы перефразированный вопрос в другом диалоге не получил чужой ответ.
+    Требует sentence-transformers и faiss-cpu (не входят в requirements.txt).
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        threshold: float = 0.92,
+        maxsize: int = 10_000,
+        top_k: int = 5,
+    ):
+        import faiss
+        from sentence_transformers import SentenceTransformer
+
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.top_k = top_k
+        self._model = SentenceTransformer(model_name)
+        self._index = faiss.IndexFlatIP(self._model.get_sentence_embedding_dimension())
+        self._entries: List[Tuple[bytes, str]] = []
+        self._lock = threading.Lock()
+
+    def embed(self, text: str):
+        return self._model.encode(
+            [text], normalize_embeddings=True, convert_to_numpy=True
+        ).astype("float32")
+
+    def lookup(self, vector, context_hash: bytes) -> Optional[str]:
+        with self._lock:
+            if self._index.ntotal == 0:
+                return None
+            scores, ids = self._index.search(vector, min(self.top_k, self._index.ntotal))
+            for score, idx in zip(scores[0], ids[0]):
+                if idx < 0 or score < self.threshold:
+                    break
+                entry_hash, response = self._entries[idx]
+                if entry_hash == context_hash:
+                    return response
+        return None
+
+    def add(self, vector, context_hash: bytes, response: str) -> None:
+        with self._lock:
+            if self._index.ntotal >= self.maxsize:
+                # IndexFlatIP не удаляет отдельные записи дёшево — начинаем заново.
+                self._index.reset()
+                self._entries.clear()
+            self._index.add(vector)
+            self._entries.append((context_hash, response))